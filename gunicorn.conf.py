@@ -1,27 +1,56 @@
 """Gunicorn configuration for libre-convert-api."""
-import multiprocessing
+import math
 import os
 
 # Server socket
 bind = f"0.0.0.0:{os.getenv('API_PORT', '28001')}"
 backlog = 2048
 
+
+def _available_cpus() -> int:
+    """CPUs this container may use: affinity mask capped by the cgroup CPU quota."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            return cpus
+    if quota in ("max", "-1"):
+        return cpus
+    return max(1, min(cpus, math.ceil(int(quota) / int(period))))
+
+
 # Worker processes
 _workers = os.getenv("API_WORKERS", "auto")
 if _workers == "auto":
-    workers = multiprocessing.cpu_count()
+    if os.getenv("API_OFFICE_POOL", "true").lower() == "true":
+        # Each worker keeps API_MAX_CONCURRENT soffice instances resident, so
+        # stay at one worker per CPU to bound their number
+        workers = _available_cpus()
+    else:
+        # One-shot conversions mostly await LibreOffice, so oversubscribe the CPUs
+        workers = 2 * _available_cpus() + 1
 else:
     workers = int(_workers)
 
-worker_class = "uvicorn.workers.UvicornWorker"
+worker_class = "workers.ConverterWorker"
 worker_connections = 1000
 max_requests = 1000
-max_requests_jitter = 50
+max_requests_jitter = max_requests // 2  # spread respawns so workers don't recycle together
+preload_app = True
 
 # Timeout
 timeout = int(os.getenv("API_TIMEOUT", "300"))
 graceful_timeout = 30
-keepalive = 5
+keepalive = 30
 
 # Logging
 accesslog = "-"
@@ -1,20 +1,37 @@
 """Multi-format document conversion service using LibreOffice."""
 import asyncio
-import json
+import errno
+import hmac
 import logging
 import os
+import shutil
+import signal
 import subprocess
 import sys
 import tempfile
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional
-
-from fastapi import Depends, FastAPI, HTTPException, Query, Request, UploadFile
-from fastapi.responses import Response
+from typing import Any, Optional
+from urllib.parse import parse_qs, quote
+
+import aiofiles
+import orjson
+import structlog
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from starlette.types import Receive, Scope, Send
 
 # -----------------------------------------------------------------------------
 # Configuration
@@ -30,6 +47,11 @@ class Config:
     TIMEOUT: int = int(os.getenv("API_TIMEOUT", "300"))
     MAX_FILE_SIZE: int = int(os.getenv("API_MAX_FILE_SIZE", "524288000"))  # 500MB
     MAX_CONCURRENT: int = int(os.getenv("API_MAX_CONCURRENT", "10"))
+    TMPFS_DIR: str = os.getenv("API_TMPFS_DIR", "/dev/shm")
+    OFFICE_POOL: bool = os.getenv("API_OFFICE_POOL", "true").lower() == "true"
+    OFFICE_POOL_SIZE: int = int(os.getenv("API_OFFICE_POOL_SIZE", "2"))  # per worker, ~100MB resident each
+    OFFICE_MAX_REQUESTS: int = int(os.getenv("API_OFFICE_MAX_REQUESTS", "200"))
+    OFFICE_START_TIMEOUT: int = int(os.getenv("API_OFFICE_START_TIMEOUT", "60"))
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "info").upper()
     LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json").lower()
 
@@ -41,34 +63,29 @@ config = Config()
 # -----------------------------------------------------------------------------
 
 
-class JSONFormatter(logging.Formatter):
-    """JSON log formatter."""
-
-    def format(self, record: logging.LogRecord) -> str:
-        log_data = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "level": record.levelname.lower(),
-            "message": record.getMessage(),
-        }
-        if hasattr(record, "extra"):
-            log_data.update(record.extra)
-        return json.dumps(log_data, ensure_ascii=False)
+log_level = getattr(logging, config.LOG_LEVEL, logging.INFO)
 
 
-def setup_logging() -> logging.Logger:
+def setup_logging() -> structlog.typing.FilteringBoundLogger:
     """Configure application logging."""
-    logger = logging.getLogger("libre-convert")
-    logger.setLevel(getattr(logging, config.LOG_LEVEL, logging.INFO))
-    logger.handlers.clear()
-
-    handler = logging.StreamHandler(sys.stdout)
+    processors = [
+        structlog.processors.add_log_level,
+        structlog.processors.TimeStamper(fmt="iso", utc=True),
+    ]
     if config.LOG_FORMAT == "json":
-        handler.setFormatter(JSONFormatter())
+        processors.append(structlog.processors.JSONRenderer(serializer=orjson.dumps))
+        logger_factory = structlog.BytesLoggerFactory(file=sys.stdout.buffer)
     else:
-        handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-
-    logger.addHandler(handler)
-    return logger
+        processors.append(structlog.dev.ConsoleRenderer(colors=False))
+        logger_factory = structlog.PrintLoggerFactory(file=sys.stdout)
+
+    structlog.configure(
+        processors=processors,
+        wrapper_class=structlog.make_filtering_bound_logger(log_level),
+        logger_factory=logger_factory,
+        cache_logger_on_first_use=True,
+    )
+    return structlog.get_logger("libre-convert")
 
 
 logger = setup_logging()
@@ -76,17 +93,265 @@ logger = setup_logging()
 
 def log_event(event: str, **kwargs):
     """Log structured event."""
-    record = logging.LogRecord(
-        name="libre-convert",
-        level=logging.INFO,
-        pathname="",
-        lineno=0,
-        msg=event,
-        args=(),
-        exc_info=None,
+    logger.info(event, **kwargs)
+
+
+# conversion_complete lines are batched in JSON mode and written every LOG_FLUSH_INTERVAL;
+# error and timeout events stay unbuffered so they survive a crash
+LOG_FLUSH_INTERVAL = 0.05
+LOG_BUFFER_LIMIT = 10000  # events beyond this between flushes are counted and dropped
+batch_conversion_logs = config.LOG_FORMAT == "json" and log_level <= logging.INFO
+log_buffer: list[dict] = []
+log_dropped = 0
+
+
+def log_conversion_complete(**kwargs):
+    """Log a conversion_complete event, batching it with others in JSON mode."""
+    global log_dropped
+    if not batch_conversion_logs:
+        log_event("conversion_complete", **kwargs)
+        return
+    if len(log_buffer) >= LOG_BUFFER_LIMIT:
+        log_dropped += 1
+        return
+    log_buffer.append(
+        {**kwargs, "event": "conversion_complete", "level": "info", "timestamp": datetime.now(timezone.utc)}
+    )
+
+
+def flush_log_buffer() -> None:
+    """Write all buffered events to stdout in a single write."""
+    global log_dropped
+    if log_dropped:
+        log_buffer.append(
+            {
+                "count": log_dropped,
+                "event": "log_events_dropped",
+                "level": "warning",
+                "timestamp": datetime.now(timezone.utc),
+            }
+        )
+        log_dropped = 0
+    if not log_buffer:
+        return
+    lines = b"\n".join(orjson.dumps(entry, option=orjson.OPT_UTC_Z) for entry in log_buffer)
+    log_buffer.clear()
+    sys.stdout.buffer.write(lines + b"\n")
+    sys.stdout.buffer.flush()
+
+
+async def flush_logs_periodically() -> None:
+    """Flush buffered events every LOG_FLUSH_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(LOG_FLUSH_INTERVAL)
+        try:
+            flush_log_buffer()
+        except Exception as e:
+            # stdout is what failed, so report on stderr; the batch is already dropped
+            print(f"log flush failed: {e!r}", file=sys.stderr)
+
+
+# -----------------------------------------------------------------------------
+# LibreOffice Worker Pool
+# -----------------------------------------------------------------------------
+
+
+# pyuno is imported lazily in each worker, never in the pre-fork gunicorn master
+uno = None
+PropertyValue = None
+
+
+def import_uno() -> bool:
+    """Import pyuno, returning False when it is unavailable (CLI fallback)."""
+    global uno, PropertyValue
+    try:
+        import uno as uno_module
+        from com.sun.star.beans import PropertyValue as property_value
+    except ImportError:
+        return False
+    uno, PropertyValue = uno_module, property_value
+    return True
+
+
+def profile_dir(slot: int) -> Path:
+    """LibreOffice user profile for a concurrency slot, private to this process."""
+    return Path(tempfile.gettempdir()) / f"lo_profile_{os.getpid()}_{slot}"
+
+
+def kill_process_group(pid: int) -> None:
+    """SIGKILL a process group; the soffice launcher forks soffice.bin into it."""
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class OfficeWorker:
+    """Persistent headless soffice instance driven over a UNO pipe."""
+
+    def __init__(self, slot: int):
+        self.slot = slot
+        self.pipe_name = f"libre-convert-{os.getpid()}-{slot}"
+        self.profile_dir = profile_dir(slot)
+        self.process: Optional[subprocess.Popen] = None
+        self.desktop = None
+        self.requests = 0
+
+    def alive(self) -> bool:
+        """Check that the soffice process is still running."""
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        """Spawn soffice and connect to its desktop."""
+        self.process = subprocess.Popen(
+            [
+                "soffice",
+                "--headless",
+                "--invisible",
+                "--nologo",
+                "--norestore",
+                "--nodefault",
+                f"-env:UserInstallation={self.profile_dir.as_uri()}",
+                f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        self.requests = 0
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        deadline = time.monotonic() + config.OFFICE_START_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                if not self.alive() or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError(f"soffice worker {self.slot} failed to start")
+                time.sleep(0.25)
+
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def stop(self) -> None:
+        """Terminate soffice, killing it if it does not exit in time."""
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass
+            self.desktop = None
+
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                kill_process_group(self.process.pid)
+                self.process.wait()
+            self.process = None
+
+    def kill(self) -> None:
+        """Kill soffice and its children immediately, e.g. after a conversion timeout."""
+        if self.process is not None:
+            kill_process_group(self.process.pid)
+            self.process.wait()
+
+    def convert(self, input_path: Path, output_path: Path, filter_name: str) -> None:
+        """Convert a document, recycling the worker when dead or worn out."""
+        if not self.alive() or self.requests >= config.OFFICE_MAX_REQUESTS:
+            self.stop()
+            self.start()
+
+        self.requests += 1
+        document = self.desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(str(input_path)),
+            "_blank",
+            0,
+            (PropertyValue(Name="Hidden", Value=True),),
+        )
+        if document is None:
+            raise RuntimeError("LibreOffice could not load the input document")
+
+        # Filters may carry options in CLI form, e.g. "Text - txt - csv (StarCalc):44,34,76"
+        name, _, options = filter_name.partition(":")
+        store_args = [PropertyValue(Name="FilterName", Value=name)]
+        if options:
+            store_args.append(PropertyValue(Name="FilterOptions", Value=options))
+
+        try:
+            document.storeToURL(uno.systemPathToFileUrl(str(output_path)), tuple(store_args))
+        finally:
+            document.close(True)
+
+
+office_workers: list[OfficeWorker] = []
+conversion_slots: Optional[asyncio.Queue] = None
+# Dedicated threads for blocking UNO calls, kept apart from the default executor
+conversion_executor: Optional[ThreadPoolExecutor] = None
+
+
+async def warm_profile(slot: int) -> None:
+    """Bootstrap a slot's LibreOffice profile so CLI conversions skip profile creation."""
+    proc = await asyncio.create_subprocess_exec(
+        "libreoffice",
+        "--headless",
+        f"-env:UserInstallation={profile_dir(slot).as_uri()}",
+        "--terminate_after_init",
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+        start_new_session=True,
     )
-    record.extra = {"event": event, **kwargs}
-    logger.handle(record)
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=config.OFFICE_START_TIMEOUT)
+    except asyncio.TimeoutError:
+        kill_process_group(proc.pid)
+        await proc.wait()
+
+
+async def start_office_pool() -> None:
+    """Set up conversion slots, each with a persistent soffice worker or a warm profile.
+
+    The pool is kept small since every soffice instance stays resident; requests
+    beyond it wait for a free worker instead of starting more instances.
+    """
+    global conversion_slots
+    conversion_slots = asyncio.Queue()
+
+    if config.OFFICE_POOL and import_uno():
+        loop = asyncio.get_running_loop()
+        pool_size = max(1, min(config.OFFICE_POOL_SIZE, config.MAX_CONCURRENT))
+        workers = [OfficeWorker(slot) for slot in range(pool_size)]
+        try:
+            await asyncio.gather(*(loop.run_in_executor(conversion_executor, worker.start) for worker in workers))
+        except Exception as e:
+            for worker in workers:
+                await loop.run_in_executor(conversion_executor, worker.stop)
+            log_event("office_pool_unavailable", error=str(e))
+        else:
+            office_workers.extend(workers)
+            for slot in range(pool_size):
+                conversion_slots.put_nowait(slot)
+            return
+
+    for slot in range(config.MAX_CONCURRENT):
+        conversion_slots.put_nowait(slot)
+    try:
+        await asyncio.gather(*(warm_profile(slot) for slot in range(config.MAX_CONCURRENT)))
+    except OSError as e:
+        log_event("profile_warmup_failed", error=str(e))
+
+
+async def stop_office_pool() -> None:
+    """Shut down all persistent soffice workers and remove slot profiles."""
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(conversion_executor, worker.stop) for worker in office_workers))
+    office_workers.clear()
+    for slot in range(config.MAX_CONCURRENT):
+        shutil.rmtree(profile_dir(slot), ignore_errors=True)
 
 
 # -----------------------------------------------------------------------------
@@ -94,21 +359,48 @@ def log_event(event: str, **kwargs):
 # -----------------------------------------------------------------------------
 
 conversion_semaphore: Optional[asyncio.Semaphore] = None
+tmpfs_dir: Optional[str] = None
+# Bytes promised to in-flight requests on tmpfs; cleanup runs in the threadpool
+tmpfs_reserved = 0
+tmpfs_lock = threading.Lock()
+
+
+def probe_tmpfs() -> Optional[str]:
+    """Return the memory-backed scratch directory if it exists and is writable."""
+    if not config.TMPFS_DIR:
+        return None
+    try:
+        os.rmdir(tempfile.mkdtemp(dir=config.TMPFS_DIR))
+    except OSError:
+        return None
+    return config.TMPFS_DIR
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager."""
-    global conversion_semaphore
+    global conversion_semaphore, conversion_executor, tmpfs_dir
     conversion_semaphore = asyncio.Semaphore(config.MAX_CONCURRENT)
+    conversion_executor = ThreadPoolExecutor(max_workers=config.MAX_CONCURRENT, thread_name_prefix="convert")
+    tmpfs_dir = probe_tmpfs()
+    await start_office_pool()
+    flush_task = asyncio.create_task(flush_logs_periodically()) if batch_conversion_logs else None
     log_event(
         "startup",
         auth_enabled=config.AUTH_ENABLED,
         max_concurrent=config.MAX_CONCURRENT,
         max_file_size=config.MAX_FILE_SIZE,
         timeout=config.TIMEOUT,
+        office_pool=len(office_workers),
+        temp_dir=tmpfs_dir or tempfile.gettempdir(),
+        temp_dir_free_bytes=shutil.disk_usage(tmpfs_dir or tempfile.gettempdir()).free,
     )
     yield
+    await stop_office_pool()
+    conversion_executor.shutdown(wait=True)
+    if flush_task is not None:
+        flush_task.cancel()
+    flush_log_buffer()
     log_event("shutdown")
 
 
@@ -116,12 +408,54 @@ async def lifespan(app: FastAPI):
 # FastAPI Application
 # -----------------------------------------------------------------------------
 
+
+class ORJSONResponse(JSONResponse):
+    """JSON response serialized with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
 app = FastAPI(
     title="Document Converter",
     description="Convert documents using LibreOffice",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
+
+# Conversion outputs worth compressing; PDF and OOXML/ODF are already compressed
+COMPRESSIBLE_OUTPUTS = frozenset({"txt", "csv", "html", "rtf"})
+
+
+class ConversionGZipMiddleware(GZipMiddleware):
+    """GZip middleware that skips /convert responses in already-compressed formats."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"] == "/convert":
+            to = parse_qs(scope["query_string"].decode("latin-1")).get("to", [""])[0]
+            if to.lower().lstrip(".") not in COMPRESSIBLE_OUTPUTS:
+                await self.app(scope, receive, send)
+                return
+        await super().__call__(scope, receive, send)
+
+
+# Level 4 keeps most of the ratio at a fraction of the CPU; compression runs on the event loop
+app.add_middleware(ConversionGZipMiddleware, minimum_size=1024, compresslevel=4)
+
+
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: Request, exc: StarletteHTTPException) -> ORJSONResponse:
+    """Render HTTP errors with orjson instead of the stdlib-json default."""
+    return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError) -> ORJSONResponse:
+    """Render request validation errors (422) with orjson."""
+    return ORJSONResponse({"detail": jsonable_encoder(exc.errors())}, status_code=422)
+
+
 # -----------------------------------------------------------------------------
 # Authentication
 # -----------------------------------------------------------------------------
@@ -132,17 +466,18 @@ security = HTTPBearer(auto_error=False)
 async def verify_auth(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
 ) -> None:
-    """Verify Bearer token if authentication is enabled."""
-    if not config.AUTH_ENABLED:
-        return
-
+    """Verify Bearer token."""
     if not credentials:
         raise HTTPException(status_code=401, detail="Authorization header required")
 
-    if credentials.credentials != config.AUTH_TOKEN:
+    if not hmac.compare_digest(credentials.credentials.encode(), config.AUTH_TOKEN.encode()):
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
+# Only attach the auth dependency when enabled, so open deployments skip it entirely
+AUTH_DEPENDENCIES = [Depends(verify_auth)] if config.AUTH_ENABLED else []
+
+
 # -----------------------------------------------------------------------------
 # Format Definitions
 # -----------------------------------------------------------------------------
@@ -222,15 +557,122 @@ CONVERSIONS = {
 }
 
 
-def get_input_ext(filename: str) -> str:
-    """Extract and validate input extension."""
+# Flattened (input, output) -> (filter, mime) lookup and pre-rendered format lists
+CONVERSION_LOOKUP = {
+    (input_fmt, output_fmt): entry
+    for input_fmt, outputs in CONVERSIONS.items()
+    for output_fmt, entry in outputs.items()
+}
+AVAILABLE_OUTPUTS = {input_fmt: ", ".join(sorted(outputs)) for input_fmt, outputs in CONVERSIONS.items()}
+SUPPORTED_INPUTS = ", ".join(sorted(CONVERSIONS))
+OUTPUT_FORMATS = frozenset(output_fmt for outputs in CONVERSIONS.values() for output_fmt in outputs)
+SUPPORTED_OUTPUTS = ", ".join(sorted(OUTPUT_FORMATS))
+FORMATS_JSON = orjson.dumps({input_fmt: list(outputs) for input_fmt, outputs in CONVERSIONS.items()})
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB
+MULTIPART_ALLOWANCE = 64 * 1024  # boundaries and part headers on top of the file itself
+
+
+@lru_cache(maxsize=4096)
+def _ext_for(filename: str) -> str:
+    """Extract and validate input extension, raising ValueError if unsupported."""
     ext = Path(filename).suffix.lower().lstrip(".")
     if ext not in CONVERSIONS:
-        supported = ", ".join(sorted(CONVERSIONS.keys()))
-        raise HTTPException(400, f"Unsupported input format: .{ext}. Supported: {supported}")
+        raise ValueError(ext)
     return ext
 
 
+def safe_filename(filename: str) -> str:
+    """Reduce a client-supplied filename to its final component so it stays in the scratch dir."""
+    name = Path(filename.replace("\\", "/")).name
+    if name in ("", ".", "..") or "\0" in name:
+        raise HTTPException(400, "Invalid filename")
+    return name
+
+
+def get_input_ext(filename: str) -> str:
+    """Extract and validate input extension."""
+    try:
+        return _ext_for(filename)
+    except ValueError as e:
+        raise HTTPException(400, f"Unsupported input format: .{e}. Supported: {SUPPORTED_INPUTS}")
+
+
+async def save_upload(file: UploadFile, path: Path) -> int:
+    """Stream an upload to disk in chunks, enforcing the size limit."""
+    input_size = 0
+    async with aiofiles.open(path, "wb") as f:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            input_size += len(chunk)
+            if input_size > config.MAX_FILE_SIZE:
+                raise HTTPException(413, f"File too large. Max: {config.MAX_FILE_SIZE} bytes")
+            await f.write(chunk)
+    return input_size
+
+
+def reserve_tmpfs(request: Request) -> int:
+    """Reserve tmpfs space for the request's scratch dir; returns bytes reserved (0 = use disk)."""
+    global tmpfs_reserved
+    if tmpfs_dir is None:
+        return 0
+    content_length = request.headers.get("content-length", "")
+    expected = int(content_length) if content_length.isdigit() else config.MAX_FILE_SIZE
+    # Input and output both live in the scratch dir
+    needed = 2 * expected
+    with tmpfs_lock:
+        if shutil.disk_usage(tmpfs_dir).free - tmpfs_reserved < needed:
+            return 0
+        tmpfs_reserved += needed
+    return needed
+
+
+def cleanup_scratch(tmpdir: str, reserved: int) -> None:
+    """Remove a scratch dir and hand back its tmpfs reservation."""
+    global tmpfs_reserved
+    if tmpdir:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    with tmpfs_lock:
+        tmpfs_reserved -= reserved
+
+
+async def stage_upload(request: Request, file: UploadFile, filename: str) -> tuple[str, int, int]:
+    """Copy the upload into a new scratch dir, on tmpfs when there is room.
+
+    Returns the scratch dir, the tmpfs bytes reserved for it and the input size.
+    """
+    reserved = reserve_tmpfs(request)
+    tmpdir = ""
+    try:
+        tmpdir = tempfile.mkdtemp(dir=tmpfs_dir if reserved else None)
+        try:
+            return tmpdir, reserved, await save_upload(file, Path(tmpdir) / filename)
+        except OSError as e:
+            if e.errno != errno.ENOSPC or not reserved:
+                raise
+
+        # tmpfs is shared with other gunicorn workers and can still fill up; retry on disk
+        cleanup_scratch(tmpdir, reserved)
+        reserved = 0
+        tmpdir = tempfile.mkdtemp()
+        await file.seek(0)
+        return tmpdir, 0, await save_upload(file, Path(tmpdir) / filename)
+    except BaseException:
+        cleanup_scratch(tmpdir, reserved)
+        raise
+
+
+def content_disposition(filename: str) -> str:
+    """Build an attachment Content-Disposition header (RFC 6266).
+
+    Non-ASCII names get an RFC 5987 filename* plus an ASCII filename fallback.
+    """
+    fallback = "".join(c if c.isascii() and c.isprintable() else "_" for c in filename)
+    header = 'attachment; filename="{}"'.format(fallback.replace("\\", "\\\\").replace('"', '\\"'))
+    if fallback == filename:
+        return header
+    return f"{header}; filename*=UTF-8''{quote(filename)}"
+
+
 def get_client_ip(request: Request) -> str:
     """Extract client IP from request."""
     forwarded = request.headers.get("x-forwarded-for")
@@ -239,101 +681,231 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
+async def convert_with_pool(
+    input_path: Path,
+    outdir: Path,
+    input_ext: str,
+    output_ext: str,
+    filter_name: str,
+    input_size: int,
+    client_ip: str,
+) -> None:
+    """Convert using a pooled persistent soffice worker."""
+    slot = await conversion_slots.get()
+    worker = office_workers[slot]
+    output_path = outdir / f"{input_path.stem}.{output_ext}"
+    future = asyncio.get_running_loop().run_in_executor(
+        conversion_executor, worker.convert, input_path, output_path, filter_name
+    )
+
+    def release_slot(done: asyncio.Future) -> None:
+        # The slot only goes back once the executor thread is done with the worker,
+        # even if this request timed out or was cancelled first
+        if not done.cancelled():
+            done.exception()  # errors are reported by the awaiting request, if any
+        conversion_slots.put_nowait(slot)
+
+    future.add_done_callback(release_slot)
+    try:
+        await asyncio.wait_for(asyncio.shield(future), timeout=config.TIMEOUT)
+    except asyncio.TimeoutError:
+        # Killing soffice unblocks the UNO call; the worker restarts on next use
+        worker.kill()
+        log_event(
+            "conversion_timeout",
+            input_format=input_ext,
+            output_format=output_ext,
+            input_size_bytes=input_size,
+            client_ip=client_ip,
+        )
+        raise HTTPException(504, "Conversion timed out")
+    except Exception as e:
+        log_event(
+            "conversion_error",
+            input_format=input_ext,
+            output_format=output_ext,
+            error=str(e)[:500],
+            client_ip=client_ip,
+        )
+        raise HTTPException(500, f"Conversion failed: {e}")
+
+
+async def convert_with_cli(
+    input_path: Path,
+    outdir: Path,
+    input_ext: str,
+    output_ext: str,
+    filter_name: str,
+    input_size: int,
+    client_ip: str,
+) -> None:
+    """Convert by spawning a one-shot libreoffice process on a slot's own profile."""
+    convert_to_arg = f"{output_ext}:{filter_name}" if filter_name else output_ext
+
+    slot = await conversion_slots.get()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "libreoffice",
+            "--headless",
+            f"-env:UserInstallation={profile_dir(slot).as_uri()}",
+            "--convert-to",
+            convert_to_arg,
+            "--outdir",
+            str(outdir),
+            str(input_path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(proc.communicate(), timeout=config.TIMEOUT)
+        except asyncio.TimeoutError:
+            # The launcher forks soffice.bin, which would otherwise keep the slot's profile locked
+            kill_process_group(proc.pid)
+            await proc.wait()
+            log_event(
+                "conversion_timeout",
+                input_format=input_ext,
+                output_format=output_ext,
+                input_size_bytes=input_size,
+                client_ip=client_ip,
+            )
+            raise HTTPException(504, "Conversion timed out")
+    finally:
+        conversion_slots.put_nowait(slot)
+
+    if proc.returncode != 0:
+        log_event(
+            "conversion_error",
+            input_format=input_ext,
+            output_format=output_ext,
+            error=stderr.decode()[:500],
+            client_ip=client_ip,
+        )
+        raise HTTPException(500, f"Conversion failed: {stderr.decode()}")
+
+
 # -----------------------------------------------------------------------------
 # Endpoints
 # -----------------------------------------------------------------------------
 
 
-@app.post("/convert")
+# The upload is parsed inside the handler, so document the multipart body by hand
+CONVERT_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                }
+            }
+        },
+    }
+}
+
+
+@app.post("/convert", openapi_extra=CONVERT_REQUEST_BODY, dependencies=AUTH_DEPENDENCIES)
 async def convert(
     request: Request,
-    file: UploadFile,
     to: str = Query(..., description="Target format (e.g., pdf, docx, xlsx)"),
-    _: None = Depends(verify_auth),
 ):
     """Convert document to specified format."""
     start_time = time.time()
     client_ip = get_client_ip(request)
 
-    if not file.filename:
-        raise HTTPException(400, "Filename required")
-
-    input_ext = get_input_ext(file.filename)
+    # Validate the target before the multipart body is consumed; auth has
+    # already run since no body parameters are declared.
     output_ext = to.lower().lstrip(".")
+    if output_ext not in OUTPUT_FORMATS:
+        raise HTTPException(400, f"Unsupported output format: .{output_ext}. Supported: {SUPPORTED_OUTPUTS}")
 
-    if output_ext not in CONVERSIONS.get(input_ext, {}):
-        available = ", ".join(sorted(CONVERSIONS[input_ext].keys()))
-        raise HTTPException(400, f"Cannot convert .{input_ext} to .{output_ext}. Available: {available}")
+    # Reject oversized bodies up front; the exact limit is enforced while staging
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > config.MAX_FILE_SIZE + MULTIPART_ALLOWANCE:
+        raise HTTPException(413, f"File too large. Max: {config.MAX_FILE_SIZE} bytes")
 
-    # Read file content and check size
-    file_content = await file.read()
-    input_size = len(file_content)
+    async with request.form(max_files=1) as form:
+        file = form.get("file")
+        if not isinstance(file, UploadFile):
+            raise HTTPException(400, "File required")
+        return await convert_upload(request, file, output_ext, start_time, client_ip)
 
-    if input_size > config.MAX_FILE_SIZE:
-        raise HTTPException(
-            413,
-            f"File too large: {input_size} bytes. Max: {config.MAX_FILE_SIZE} bytes",
-        )
 
-    filter_name, mime_type = CONVERSIONS[input_ext][output_ext]
+async def convert_upload(
+    request: Request,
+    file: UploadFile,
+    output_ext: str,
+    start_time: float,
+    client_ip: str,
+) -> FileResponse:
+    """Convert an uploaded document whose target format is already known to be valid."""
+    if not file.filename:
+        raise HTTPException(400, "Filename required")
 
-    # Acquire semaphore for concurrency control
-    if not conversion_semaphore.locked() or conversion_semaphore._value > 0:
-        pass  # Can proceed
-    else:
-        raise HTTPException(429, "Too many concurrent requests. Please retry later.")
+    filename = safe_filename(file.filename)
+    input_ext = get_input_ext(filename)
 
-    async with conversion_semaphore:
-        with tempfile.TemporaryDirectory() as tmpdir:
-            input_path = Path(tmpdir) / file.filename
-            with open(input_path, "wb") as f:
-                f.write(file_content)
+    entry = CONVERSION_LOOKUP.get((input_ext, output_ext))
+    if entry is None:
+        raise HTTPException(
+            400,
+            f"Cannot convert .{input_ext} to .{output_ext}. Available: {AVAILABLE_OUTPUTS[input_ext]}",
+        )
 
-            # Build convert command
-            convert_to_arg = f"{output_ext}:{filter_name}" if filter_name else output_ext
+    filter_name, mime_type = entry
 
-            try:
-                result = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: subprocess.run(
-                        ["libreoffice", "--headless", "--convert-to", convert_to_arg, "--outdir", tmpdir, str(input_path)],
-                        capture_output=True,
-                        timeout=config.TIMEOUT,
-                    ),
-                )
-            except subprocess.TimeoutExpired:
-                log_event(
-                    "conversion_timeout",
-                    input_format=input_ext,
-                    output_format=output_ext,
-                    input_size_bytes=input_size,
-                    client_ip=client_ip,
-                )
-                raise HTTPException(504, "Conversion timed out")
-
-            if result.returncode != 0:
-                log_event(
-                    "conversion_error",
-                    input_format=input_ext,
-                    output_format=output_ext,
-                    error=result.stderr.decode()[:500],
-                    client_ip=client_ip,
-                )
-                raise HTTPException(500, f"Conversion failed: {result.stderr.decode()}")
-
-            # Find output file
-            output_files = list(Path(tmpdir).glob(f"*.{output_ext}"))
-            if not output_files:
-                raise HTTPException(500, "Conversion produced no output")
-
-            with open(output_files[0], "rb") as f:
-                content = f.read()
-
-    output_size = len(content)
+    # Acquire semaphore for concurrency control; reject instead of queueing when full.
+    # acquire() on an unlocked semaphore never suspends, so check-then-acquire is atomic.
+    if conversion_semaphore.locked():
+        raise HTTPException(
+            429,
+            "Too many concurrent requests. Please retry later.",
+            headers={"Retry-After": "1"},
+        )
+    await conversion_semaphore.acquire()
+
+    # Temp dir outlives the handler; it is removed once the response is sent
+    tmpdir = None
+    try:
+        try:
+            tmpdir, reserved, input_size = await stage_upload(request, file, filename)
+        except OSError as e:
+            log_event(
+                "conversion_error",
+                input_format=input_ext,
+                output_format=output_ext,
+                error=str(e)[:500],
+                client_ip=client_ip,
+            )
+            if e.errno == errno.ENOSPC:
+                raise HTTPException(507, "Insufficient storage for conversion")
+            raise HTTPException(500, "Failed to store upload")
+
+        input_path = Path(tmpdir) / filename
+
+        if office_workers:
+            await convert_with_pool(input_path, Path(tmpdir), input_ext, output_ext, filter_name, input_size, client_ip)
+        else:
+            await convert_with_cli(input_path, Path(tmpdir), input_ext, output_ext, filter_name, input_size, client_ip)
+
+        # Find output file
+        output_files = list(Path(tmpdir).glob(f"*.{output_ext}"))
+        if not output_files:
+            raise HTTPException(500, "Conversion produced no output")
+    except BaseException:
+        if tmpdir is not None:
+            cleanup_scratch(tmpdir, reserved)
+        raise
+    finally:
+        conversion_semaphore.release()
+
+    output_size = output_files[0].stat().st_size
     duration_ms = int((time.time() - start_time) * 1000)
 
-    log_event(
-        "conversion_complete",
+    log_conversion_complete(
         input_format=input_ext,
         output_format=output_ext,
         input_size_bytes=input_size,
@@ -342,18 +914,19 @@ async def convert(
         client_ip=client_ip,
     )
 
-    output_filename = Path(file.filename).stem + f".{output_ext}"
-    return Response(
-        content=content,
+    output_filename = Path(filename).stem + f".{output_ext}"
+    return FileResponse(
+        path=str(output_files[0]),
         media_type=mime_type,
-        headers={"Content-Disposition": f'attachment; filename="{output_filename}"'},
+        headers={"Content-Disposition": content_disposition(output_filename)},
+        background=BackgroundTask(cleanup_scratch, tmpdir, reserved),
     )
 
 
-@app.get("/formats")
-async def list_formats(_: None = Depends(verify_auth)):
+@app.get("/formats", dependencies=AUTH_DEPENDENCIES)
+async def list_formats():
     """List all supported format conversions."""
-    return {input_fmt: list(outputs.keys()) for input_fmt, outputs in CONVERSIONS.items()}
+    return Response(content=FORMATS_JSON, media_type="application/json")
 
 
 @app.get("/health")
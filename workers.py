@@ -0,0 +1,12 @@
+"""Gunicorn worker classes for libre-convert-api."""
+from uvicorn.workers import UvicornWorker
+
+
+class ConverterWorker(UvicornWorker):
+    """Uvicorn worker running on uvloop with the httptools HTTP parser."""
+
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        "limit_concurrency": 1000,
+    }